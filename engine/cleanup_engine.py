@@ -6,6 +6,7 @@ It validates and prints a summary of the config file.
 """
 
 import json
+import re
 import argparse
 from pathlib import Path
 import os
@@ -13,20 +14,50 @@ import sys
 import shutil
 import datetime
 import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# magic.Magic serialises calls on an internal lock, so each worker thread keeps its own
+# instance (the magic database is still loaded once per thread, not per file)
+_magic_local = threading.local()
 
 try:
 	import magic  # python-magic
+	_magic_local.instance = magic.Magic(mime=True)
 	_HAVE_MAGIC = True
 except Exception:
 	_HAVE_MAGIC = False
 
+try:
+	import ahocorasick  # pyahocorasick
+	_HAVE_AHOCORASICK = True
+except Exception:
+	_HAVE_AHOCORASICK = False
+
+# rename relative to open directory fds (renameat) where the platform allows it
+_HAVE_RENAMEAT = os.rename in os.supports_dir_fd
+
+# shell-like constructs rejected in config paths: "$(", "`", ";", "|", "&"
+_FORBIDDEN_RE = re.compile(r'\$\(|[`;|&]')
+
+# bytes read from each file for content sniffing
+MIME_HEADER_BYTES = 4096
+# leading magic bytes of the most common Downloads content, checked before libmagic
+# (no ZIP entry: libmagic tells docx/odt/epub and other ZIP containers apart)
+_MIME_SIGNATURES = (
+	(b"%PDF", "application/pdf"),
+	(b"\xff\xd8\xff", "image/jpeg"),
+	(b"\x89PNG\r\n\x1a\n", "image/png"),
+	(b"GIF87a", "image/gif"),
+	(b"GIF89a", "image/gif"),
+)
+
 
 def expand_path(raw_path: str) -> Path:
 	if not isinstance(raw_path, str):
 		raise ValueError(f"Invalid path type (expected string): {raw_path}")
 
-	forbidden_patterns = ["$(", "`", ";", "|", "&"]
-	if any(passed_path in raw_path for passed_path in forbidden_patterns):
+	if _FORBIDDEN_RE.search(raw_path):
 		raise ValueError(
 				f"Forbidden shell-like expression detected in path: {raw_path}\n"
 				"Use only '~' or '$HOME' for dynamic user resolution."
@@ -43,64 +74,95 @@ def load_config(config_file_path) -> dict:
 	return json.loads(config_file.read_text(encoding='utf-8'))
 
 
-def validate_config_paths(config: dict):
+class ConfigValidationError(ValueError):
+	"""Raised for invalid config paths; errors holds one message per bad entry."""
+
+	def __init__(self, errors: list):
+		super().__init__("\n".join(errors))
+		self.errors = errors
+
+
+def resolve_routing_targets(config: dict, errors: list = None) -> dict:
 	"""
-	Validates all paths in:
-		- paths.*
-		- routing.keyword_map.*.target
-		- routing.extension_map.*
-		- routing.mime_map.*
-	Every path must exist or we fail immediately.
+	Resolve the routing targets once per run:
+		{"keyword": {keyword: Path}, "extension": {extension: Path}, "mime": {mime: Path}}
+	Missing targets are appended to errors when a list is given; otherwise
+	they raise ConfigValidationError. paths.* is not checked here.
 	"""
-	errors = []
-
-	# 1. Validate top-level paths
-	paths_section = config.get("paths", {})
-	for name, raw_path in paths_section.items():
-		resolved = expand_path(raw_path)
-		if not resolved.exists():
-			errors.append(f"[paths.{name}] Missing directory: {resolved}")
+	collected = [] if errors is None else errors
+	targets = {"keyword": {}, "extension": {}, "mime": {}}
 
-	# 2. Keyword targets
+	# 1. Keyword targets
 	keyword_map = config.get("routing", {}).get("keyword_map", {})
 	for keyword, rule in keyword_map.items():
 		target = rule.get("target")
-		resolved = expand_path(target)
 		if target is None:
-			errors.append(f"[keyword_map.{key}] Missing target field")
+			collected.append(f"[keyword_map.{keyword}] Missing target field")
 			continue
 		resolved = expand_path(target)
 		if not resolved.exists():
-			errors.append(f"[keyword_map.{keyword}] Missing target directory: {resolved}")
+			collected.append(f"[keyword_map.{keyword}] Missing target directory: {resolved}")
+		targets["keyword"][keyword] = resolved
 
-	# 3. Extension targets
+	# 2. Extension targets
 	extension_map = config.get("routing", {}).get("extension_map", {}) or {}
 	for extension, raw_target in extension_map.items():
 		resolved = expand_path(raw_target)
 		if not resolved.exists():
-			errors.append(f"[extension_map.{extension}] Missing target directory: {resolved}")
+			collected.append(f"[extension_map.{extension}] Missing target directory: {resolved}")
+		targets["extension"][extension] = resolved
 
-	# 4. MIME targets
+	# 3. MIME targets
 	mime_map = config.get("routing", {}).get("mime_map", {}) or {}
 	for mime_type, raw_target in mime_map.items():
 		resolved = expand_path(raw_target)
 		if not resolved.exists():
-			errors.append(f"[mime_map.{mime_type}] Missing target directory: {resolved}")
+			collected.append(f"[mime_map.{mime_type}] Missing target directory: {resolved}")
+		targets["mime"][mime_type] = resolved
+
+	if errors is None and collected:
+		raise ConfigValidationError(collected)
+
+	return targets
+
+
+def validate_config_paths(config: dict):
+	"""
+	Validates all paths in:
+		- paths.*
+		- routing.keyword_map.*.target
+		- routing.extension_map.*
+		- routing.mime_map.*
+	Every path must exist, otherwise ConfigValidationError lists every failure
+	(main reports them and exits).
+	Returns the resolved routing targets (see resolve_routing_targets).
+	"""
+	errors = []
+
+	# Top-level paths
+	paths_section = config.get("paths", {})
+	for name, raw_path in paths_section.items():
+		resolved = expand_path(raw_path)
+		if not resolved.exists():
+			errors.append(f"[paths.{name}] Missing directory: {resolved}")
+
+	targets = resolve_routing_targets(config, errors)
 
-	# FAIL FAST if any error found
 	if errors:
-		print("CONFIG VALIDATION FAILED:", file=sys.stderr)
-		for err in errors:
-			print(f"  - {err}", file=sys.stderr)
-		sys.exit(3)
+		raise ConfigValidationError(errors)
+
+	return targets
 
 
 def discover_files(downloads_path: Path):
 	"""
-	Return a list of file Paths in downloads_path.
+	Return a list of (name, path, DirEntry) tuples for files in downloads_path, in readdir order.
 	- ignores directories
 	- ignores hidden files (starting with .)
-	- ignores symlinks to dirs (but will include regular symlink files)
+	- ignores symlinks (DirEntry.is_file is called without following them)
+	Uses os.scandir so the file type comes from readdir instead of an extra stat per entry.
+	The DirEntry is kept so only files that reach detect_mime are stat'ed (DirEntry.stat
+	caches the result; on POSIX it is still one lstat, so it is not called up front).
 	"""
 	
 	files = []
@@ -108,60 +170,167 @@ def discover_files(downloads_path: Path):
 	if not downloads_path.exists():
 		return files
 	
-	for file_entry in downloads_path.iterdir():
-		if file_entry.name.startswith("."):
-			continue
-		
-		try:
-			if file_entry.is_file():
-				files.append(file_entry)
-		except Exception:
-			continue
-	return sorted(files, key=lambda file: file.name.lower())
-
-
-def match_keyword(filename: str, keyword_map: dict):
+	with os.scandir(downloads_path) as entries:
+		for entry in entries:
+			if entry.name.startswith("."):
+				continue
+			
+			try:
+				if entry.is_file(follow_symlinks=False):
+					files.append((entry.name, entry.path, entry))
+			except OSError:
+				continue
+	# readdir order; pretty_print_plan sorts its output for display
+	return files
+
+
+def match_keyword(lower_name: str, keyword_targets: dict):
 	"""
-	Case-insensitive substring matching.
+	Case-insensitive substring matching; lower_name is the already-lowercased filename.
+	keyword_targets maps keyword -> resolved target Path (see validate_config_paths).
 	Returns (matched_rule_key, target_path) or (None, None)
 	First-match wins in the order of insertion of keyword_map (preserves config order).
 	"""
 	
-	lower_name = filename.lower()
-	
-	for key, rule in keyword_map.items():
+	for key, target in keyword_targets.items():
 		token = str(key).lower()
 		if token in lower_name:
-			return key, rule.get("target")
+			return key, target
 	return None, None
 
 
-def match_extension(filename: str, extension_map: dict):
+def build_extension_index(extension_targets: dict) -> tuple:
 	"""
-	Match file extension (no dot). Returns (extension, target) or (None, None)
+	Return ((".suffix", target), ...) sorted longest suffix first, so multi-part
+	extensions such as "tar.gz" win over "gz". Equal lengths keep config order.
 	"""
 	
-	suffix = Path(filename).suffix.lower().lstrip(".")
+	index = [("." + str(extension).lower(), target) for extension, target in extension_targets.items() if extension]
+	return tuple(sorted(index, key=lambda entry: -len(entry[0])))
+
+
+def match_extension(lower_name: str, extension_index: tuple):
+	"""
+	Match the lowercased filename against extension_index (see build_extension_index).
+	Returns (extension without leading dot, target) or (None, None)
+	"""
 	
-	if not suffix:
-		return None, None
+	for suffix, target in extension_index:
+		if lower_name.endswith(suffix) and target:
+			return suffix[1:], target
+	
+	return None, None
+
+
+def build_name_automaton(keyword_targets: dict, extension_index: tuple):
+	"""
+	Build one Aho-Corasick automaton over the lowercased keywords and the ".suffix"
+	patterns of extension_index, so both stages share a single scan of the filename.
+	Each pattern stores its (priority, stage, rule, target) hits; priority is (0, config index)
+	for keywords and (1, extension_index position) for extensions, so keywords still win
+	and longer suffixes beat shorter ones.
+	Returns None when pyahocorasick is unavailable (match_keyword/match_extension then loop).
+	"""
+
+	if not _HAVE_AHOCORASICK or not (keyword_targets or extension_index):
+		return None
+
+	patterns = {}
+	for index, (key, target) in enumerate(keyword_targets.items()):
+		token = str(key).lower()
+		if not token:
+			# an empty keyword matches everything; leave that to the plain loop
+			return None
+		patterns.setdefault(token, []).append(((0, index), "keyword", key, target))
+	for index, (suffix, target) in enumerate(extension_index):
+		if target:
+			patterns.setdefault(suffix, []).append(((1, index), "extension", suffix[1:], target))
+
+	automaton = ahocorasick.Automaton()
+	for pattern, hits in patterns.items():
+		automaton.add_word(pattern, tuple(hits))
+	automaton.make_automaton()
+	return automaton
+
+
+def match_name(lower_name: str, automaton):
+	"""
+	Single-pass keyword + extension match (see build_name_automaton).
+	Extension patterns only count when they end the filename.
+	Returns (stage, rule, target) or (None, None, None)
+	"""
 	
-	target = extension_map.get(suffix)
+	best = None
+	last = len(lower_name) - 1
+	for end, hits in automaton.iter(lower_name):
+		for hit in hits:
+			if hit[1] == "extension" and end != last:
+				continue
+			if best is None or hit[0] < best[0]:
+				best = hit
 	
-	if target:
-		return suffix, target
+	if best is None:
+		return None, None, None
+	return best[1], best[2], best[3]
+
+
+def guess_mime_from_extension(extension_no_dot: str) -> str:
+	"""
+	Return the mime type implied by the extension alone (no file I/O), or "".
+	"""
 	
-	return None, None
+	if not extension_no_dot:
+		return ""
+	
+	if not mimetypes.inited:
+		mimetypes.init()
+	return mimetypes.types_map.get("." + extension_no_dot, "")
+
+
+def _get_mime_magic():
+	"""Return the calling thread's magic.Magic instance, creating it on first use.
+	"""
+	
+	instance = getattr(_magic_local, "instance", None)
+	if instance is None:
+		instance = magic.Magic(mime=True)
+		_magic_local.instance = instance
+	return instance
 
 
-def detect_mime(path: Path):
+def _read_header(path, n: int = MIME_HEADER_BYTES) -> bytes:
+	"""Return the first n bytes of path (a single read).
+	"""
+	
+	with open(path, "rb") as header_file:
+		return header_file.read(n)
+
+
+def detect_mime(path, st: os.stat_result = None, header: bytes = None):
 	"""
 	Return normalized mime string (e.g., 'image', 'video', 'application/pdf', 'text')
+	st is the file's stat result if already known (e.g. from the DirEntry kept by discover_files).
+	header is the file's leading bytes if already read; otherwise one read of
+	MIME_HEADER_BYTES is made and shared by the signature check and libmagic.
 	"""
 	
 	if _HAVE_MAGIC:
+		if st is not None and st.st_size == 0:
+			# libmagic reports empty files as inode/x-empty; no need to open them
+			return "inode/x-empty"
 		try:
-			mime_magic = magic.from_file(str(path), mime=True)
+			if header is None:
+				header = _read_header(path)
+			if not header:
+				# match what libmagic's from_file reports for empty files
+				mime_magic = "inode/x-empty"
+			else:
+				for signature, signature_mime in _MIME_SIGNATURES:
+					if header.startswith(signature):
+						mime_magic = signature_mime
+						break
+				else:
+					mime_magic = _get_mime_magic().from_buffer(header)
 			return mime_magic
 		except Exception:
 			pass
@@ -170,9 +339,10 @@ def detect_mime(path: Path):
 	return guessed or ""
 
 
-def match_mime(mime_str: str, mime_map: dict):
+def match_mime(mime_str: str, mime_targets: dict):
 	"""
 	Return (matched_key, target) or (None, None).
+	mime_targets maps mime key -> resolved target Path.
 	We support:
 		- exact mime matches (application/pdf)
 		- prefix matches like 'image/' -> map key 'image'
@@ -181,71 +351,315 @@ def match_mime(mime_str: str, mime_map: dict):
 	if not mime_str:
 		return None, None
 	
-	if mime_map.get(mime_str):
-		return mime_str, mime_map[mime_str]
+	if mime_targets.get(mime_str):
+		return mime_str, mime_targets[mime_str]
 	
 	prefix = mime_str.split("/", 1)[0]
-	if mime_map.get(prefix):
-		return prefix, mime_map[prefix]
+	if mime_targets.get(prefix):
+		return prefix, mime_targets[prefix]
 	
 	return None, None
 
 
+def classify_by_name(filename: str, keyword_targets: dict, extension_index: tuple,
+		name_automaton, mime_targets: dict, mime_by_extension: dict = None):
+	"""
+	Route a file using only its name: keyword, then extension, then the mime type implied
+	by the extension. Returns (stage, rule, target) or (None, None, None) when the file
+	still needs content sniffing (detect_mime) or the archive fallback.
+	mime_by_extension memoises the extension -> mime step across calls (see classify_batch).
+	"""
+	
+	# computed once per file and shared by the matchers below
+	lower_name = filename.lower()
+	extension_no_dot = os.path.splitext(lower_name)[1][1:]
+	
+	# 1) keyword + 2) extension, in one scan when the automaton is available
+	if name_automaton is not None:
+		stage, rule, target = match_name(lower_name, name_automaton)
+		if stage:
+			return stage, rule, target
+	else:
+		keyword_key, keyword_target = match_keyword(lower_name, keyword_targets)
+		if keyword_key:
+			return "keyword", keyword_key, keyword_target
+		
+		extension, extension_target = match_extension(lower_name, extension_index)
+		if extension:
+			return "extension", extension, extension_target
+	
+	# 3) mime, when the extension alone already implies a mapped type (no file I/O)
+	if mime_targets:
+		if mime_by_extension is not None and extension_no_dot in mime_by_extension:
+			mime_match, mime_target = mime_by_extension[extension_no_dot]
+		else:
+			mime_match, mime_target = match_mime(guess_mime_from_extension(extension_no_dot), mime_targets)
+			if mime_by_extension is not None:
+				mime_by_extension[extension_no_dot] = (mime_match, mime_target)
+		if mime_match:
+			return "mime", mime_match, mime_target
+	
+	return None, None, None
+
+
+def classify_batch(filenames: list, keyword_targets: dict, extension_index: tuple,
+		name_automaton, mime_targets: dict):
+	"""
+	Classify a whole run by name in one call.
+	Returns parallel (stages, rules, targets) lists, one row per filename; stage is None
+	when the file still needs detect_mime, "error" (with the message as target) on failure.
+	The extension -> mime lookup is shared across the batch, since Downloads folders
+	repeat a handful of extensions.
+	"""
+	
+	stages, rules, targets = [], [], []
+	mime_by_extension = {}
+	for filename in filenames:
+		try:
+			stage, rule, target = classify_by_name(
+				filename, keyword_targets, extension_index, name_automaton, mime_targets, mime_by_extension)
+		except Exception as e:
+			stage, rule, target = "error", None, str(e)
+		stages.append(stage)
+		rules.append(rule)
+		targets.append(target)
+	return stages, rules, targets
+
+
 def ensure_dir(path: Path):
 	"""Create dir if missing. In strict mode this should already exist for config targets.
 	"""
 	path.mkdir(parents=True, exist_ok=True)
 
 
-def make_collision_safe_target(destination_dir: Path, filename: str) -> Path:
+def ensure_dir_or_raise(path: Path, archive_base: Path):
+	"""Make sure a destination directory exists before moving into it.
+	Only archive date folders are created automatically; config targets must already exist.
+	"""
+	if not path.exists():
+		# Enforce strict mode: config target directories must exist (we validated earlier).
+		if str(path).startswith(str(archive_base)):
+			ensure_dir(path)
+		else:
+			raise RuntimeError(f"Destination parent does not exist for non-archive target: {path}")
+
+
+def list_dir_names(directory) -> set:
+	"""Return the set of entry names in directory (empty if it does not exist yet
+	or cannot be listed, e.g. a write-only directory).
+	"""
+
+	try:
+		with os.scandir(directory) as entries:
+			return {entry.name for entry in entries}
+	except OSError:
+		return set()
+
+
+def make_collision_safe_target(destination_dir, filename: str, name_cache: dict = None) -> str:
 	"""If destination/filename exists, append ' (n)' before extension.
+	Works on plain strings; the caller builds a Path only when moving.
+	name_cache maps a directory string to the set of names in it; each directory is
+	listed once per run and the chosen name is recorded so later files in the same
+	run do not collide with it either.
+	The listing is only a hint: a candidate is used only once os.path.lexists agrees,
+	which covers unlistable directories and case-insensitive filesystems.
 	"""
 
-	destination = destination_dir / filename
+	if name_cache is None:
+		name_cache = {}
+	dir_key = os.fspath(destination_dir)
+	existing = name_cache.get(dir_key)
+	if existing is None:
+		existing = list_dir_names(dir_key)
+		name_cache[dir_key] = existing
 
-	if not destination.exists():
-		return destination
-    
-	name = filename
-	stem = Path(filename).stem
-	suffix = Path(filename).suffix  # includes dot if present
-	
+	final_name = filename
+	stem, suffix = os.path.splitext(filename)  # suffix includes dot if present
 	counter = 1
-	while True:
-		candidate = destination_dir / f"{stem} ({counter}){suffix}"
-		if not candidate.exists():
-			return candidate
+	while final_name in existing or os.path.lexists(os.path.join(dir_key, final_name)):
+		final_name = f"{stem} ({counter}){suffix}"
 		counter += 1
 
+	existing.add(final_name)
+	return os.path.join(dir_key, final_name)
+
 
-def do_move(src: Path, destination: Path):
+def do_move(src: Path, destination: Path, src_dev: int = None, destination_dev: int = None,
+		src_dir_fd: int = None, destination_dir_fd: int = None):
 	"""
-	Perform safe move: attempt atomic replace if same filesystem, otherwise shutil.move.
+	Perform safe move: atomic os.replace (a plain rename) if same filesystem, otherwise shutil.move.
+	shutil.move is also the fallback whenever the rename itself fails.
+	src_dev / destination_dev are st_dev values the caller may already know; missing ones are stat'ed.
+	When both parent directory fds are given the rename is issued as renameat on the bare names,
+	so the kernel does not walk the full paths again for every file.
+	The caller guarantees destination.parent exists (see ensure_dir_or_raise).
 	Returns final destination Path.
 	"""
 
 	try:
-		# create parent if needed (archive subfolder may be autogen)
-		destination.parent.mkdir(parents=True, exist_ok=True)
-
-		try:
-			os.replace(str(src), str(destination))
-		except OSError:
-			# fallback
-			shutil.move(str(src), str(destination))
+		if src_dev is None:
+			src_dev = src.stat().st_dev
+		if destination_dev is None:
+			destination_dev = destination.parent.stat().st_dev
+
+		if src_dev == destination_dev and src_dir_fd is not None and destination_dir_fd is not None:
+			try:
+				os.replace(src.name, destination.name, src_dir_fd=src_dir_fd, dst_dir_fd=destination_dir_fd)
+			except OSError:
+				shutil.move(src, destination)
+		elif src_dev == destination_dev:
+			try:
+				os.replace(src, destination)
+			except OSError:
+				# equal st_dev can still be EXDEV (e.g. bind mounts); fall back to copy+delete
+				shutil.move(src, destination)
+		else:
+			shutil.move(src, destination)
 		return destination
 	except Exception as e:
 		raise
 
 
-def process_run(config: dict, dry_run: bool = True):
+def _try_detect_mime(entry: list):
+	"""Run detect_mime for a classified [filename, file_path, dir_entry, ...] row and
+	return (mime, None) or (None, exception), so one bad file cannot end the run.
+	"""
+
+	try:
+		return detect_mime(entry[1], entry[2].stat(follow_symlinks=False)), None
+	except Exception as e:
+		return None, e
+
+
+def _try_move(move_args: tuple):
+	"""Run do_move(*move_args) and return (final_destination, None) or (None, exception).
+	"""
+
+	try:
+		return do_move(*move_args), None
+	except Exception as e:
+		return None, e
+
+
+def new_actions() -> dict:
+	"""
+	Return an empty action log in columnar (struct-of-arrays) form:
+	parallel "stage", "rule", "src" and "dst" lists, one row per file.
+	Error rows use stage "error", rule None and the message in "dst".
+	"""
+
+	return {"stage": [], "rule": [], "src": [], "dst": []}
+
+
+def add_action(actions: dict, stage: str, rule, src: str, destination: str):
+	"""Append one row to an action log created by new_actions.
+	"""
+
+	actions["stage"].append(stage)
+	actions["rule"].append(rule)
+	actions["src"].append(src)
+	actions["dst"].append(destination)
+
+
+def _open_dir_fd(path):
+	"""Return a read-only fd for directory path, or None when renameat is unavailable or
+	the directory cannot be opened (do_move then renames by path).
+	"""
+
+	if not _HAVE_RENAMEAT:
+		return None
+	try:
+		return os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+	except OSError:
+		return None
+
+
+def execute_moves(planned: dict, downloads: Path, archive_base: Path, counts: dict, executor=None) -> dict:
+	"""
+	Carry out the planned moves (an action log from new_actions) after classification.
+	Directory fds and st_dev values are opened/stat'ed once per directory and reused for
+	every file, so each move is a single renameat on the common same-filesystem path.
+	Directories are prepared on the calling thread; the moves themselves run on executor
+	(in order, via executor.map) when one is given.
+	Returns the performed actions; failures become error rows.
+	"""
+
+	if all(stage == "error" for stage in planned["stage"]):
+		# nothing to move, so Downloads is not stat'ed or opened (it may not even exist)
+		return planned
+
+	actions = new_actions()
+	downloads_dev = downloads.stat().st_dev
+	# destination directory string -> (st_dev, dir fd or None)
+	destination_dirs = {}
+	downloads_fd = _open_dir_fd(downloads)
+
+	try:
+		# do_move args per planned row in plan order; None for rows that are not moved
+		row_args = []
+		# row index -> error message for rows whose destination could not be prepared
+		prepare_errors = {}
+		for index, (stage, src_path, destination_path) in enumerate(zip(planned["stage"], planned["src"], planned["dst"])):
+			if stage == "error":
+				row_args.append(None)
+				continue
+
+			try:
+				destination_path = Path(destination_path)
+				# ensure destination parent exists (archive date folder allowed), once per directory
+				destination_parent = destination_path.parent
+				destination_dir = destination_dirs.get(str(destination_parent))
+				if destination_dir is None:
+					ensure_dir_or_raise(destination_parent, archive_base)
+					destination_dir = (destination_parent.stat().st_dev, _open_dir_fd(destination_parent))
+					destination_dirs[str(destination_parent)] = destination_dir
+				destination_dev, destination_fd = destination_dir
+				row_args.append((Path(src_path), destination_path, downloads_dev, destination_dev,
+						downloads_fd, destination_fd))
+			except Exception as e:
+				counts["errors"] += 1
+				prepare_errors[index] = str(e)
+				row_args.append(None)
+
+		mapper = executor.map if executor is not None else map
+		results = mapper(_try_move, [move_args for move_args in row_args if move_args is not None])
+		for index, move_args in enumerate(row_args):
+			stage, rule, src_path = planned["stage"][index], planned["rule"][index], planned["src"][index]
+			if index in prepare_errors:
+				add_action(actions, "error", None, src_path, prepare_errors[index])
+				continue
+			if move_args is None:
+				add_action(actions, stage, rule, src_path, planned["dst"][index])
+				continue
+			final_destination, error = next(results)
+			if error is None:
+				add_action(actions, stage, rule, src_path, str(final_destination))
+			else:
+				counts["errors"] += 1
+				add_action(actions, "error", None, src_path, str(error))
+	finally:
+		for _, destination_fd in destination_dirs.values():
+			if destination_fd is not None:
+				os.close(destination_fd)
+		if downloads_fd is not None:
+			os.close(downloads_fd)
+
+	return actions
+
+
+def process_run(config: dict, dry_run: bool = True, targets: dict = None):
 	paths = config["paths"]
 	downloads = expand_path(paths["downloads"])
 	archive_base = expand_path(paths["archive_base"])
 
-	keyword_map = config.get("routing", {}).get("keyword_map", {}) or {}
-	extension_map = config.get("routing", {}).get("extension_map", {}) or {}
-	mime_map = config.get("routing", {}).get("mime_map", {}) or {}
+	# Routing targets are expanded once at config-load time, not per file
+	if targets is None:
+		targets = resolve_routing_targets(config)
+	keyword_targets = targets["keyword"]
+	extension_index = build_extension_index(targets["extension"])
+	mime_targets = targets["mime"]
+	name_automaton = build_name_automaton(keyword_targets, extension_index)
 
 	# Counters
 	counts = {
@@ -257,76 +671,64 @@ def process_run(config: dict, dry_run: bool = True):
 		"errors": 0,
 	}
 
-	actions = []  # collect planned actions for dry-run or logging
+	planned = new_actions()  # classify every file first; moves are executed as one batch afterwards
+
+	# directory listings used for collision-safe naming, filled on first use
+	name_cache = {}
+
+	# archive date folder is fixed for the whole run; it may be created later (allowed)
+	today = datetime.date.today().isoformat()
+	archive_dir = archive_base / today
 
 	files = discover_files(downloads)
 	counts["scanned"] = len(files)
 
-	for file in files:
-		try:
-			filename = file.name
-			matched = False
-
-			# 1) keyword
-			keyword_key, keyword_target = match_keyword(filename, keyword_map)
-			if keyword_key:
-				destination_dir = expand_path(keyword_target)
-				destination = make_collision_safe_target(destination_dir, filename)
-				action = ("keyword", keyword_key, file, destination)
-				matched = True
-				counts["keyword"] += 1
-
-			# 2) extension
-			if not matched:
-				extension, extension_target = match_extension(filename, extension_map)
-				if extension:
-					destination_dir = expand_path(extension_target)
-					destination = make_collision_safe_target(destination_dir, filename)
-					action = ("extension", extension, file, destination)
-					matched = True
-					counts["extension"] += 1
-
-			# 3) mime
-			if not matched:
-				mime_magic = detect_mime(file)
-				mime_match, mime_target = match_mime(mime_magic, mime_map)
-				if mime_match:
-					destination_dir = expand_path(mime_target)
-					destination = make_collision_safe_target(destination_dir, filename)
-					action = ("mime", mime_match, file, destination)
-					matched = True
-					counts["mime"] += 1
-
-			# 4) archive fallback
-			if not matched:
-				today = datetime.date.today().isoformat()
-				archive_dir = archive_base / today
-				# archive folder may be created here (allowed)
-				destination = make_collision_safe_target(archive_dir, filename)
-				action = ("archive", "archive_fallback", file, destination)
-				counts["archived"] += 1
-
-			# Execute or plan
-			if dry_run:
-				actions.append(action)
-			else:
-				stage, rule, src_path, destination_path = action
-				# ensure destination parent exists (archive date folder allowed)
-				destination_parent = destination_path.parent
-				if not destination_parent.exists():
-					# Only create archive date folder automatically; do not create other config targets.
-					# Enforce strict mode: config target directories must exist (we validated earlier).
-					if str(destination_parent).startswith(str(archive_base)):
-						destination_parent.mkdir(parents=True, exist_ok=True)
-					else:
-						raise RuntimeError(f"Destination parent does not exist for non-archive target: {destination_parent}")
-				final_destination = do_move(src_path, destination_path)
-				actions.append((stage, rule, str(src_path), str(final_destination)))
-
-		except Exception as e:
-			counts["errors"] += 1
-			actions.append(("error", None, str(file), str(e)))
-			continue
+	# [filename, file_path, dir_entry, stage, rule, target]; stage None means "not matched yet"
+	stages, rules, routed_targets = classify_batch(
+		[file[0] for file in files], keyword_targets, extension_index, name_automaton, mime_targets)
+	classified = [
+		[filename, file_path, dir_entry, stage, rule, target]
+		for (filename, file_path, dir_entry), stage, rule, target in zip(files, stages, rules, routed_targets)
+	]
+
+	with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+		# 3) mime: libmagic header reads release the GIL, so unmatched files are sniffed in parallel.
+		# executor.map keeps input order, and results are applied on this thread.
+		unmatched = [entry for entry in classified if entry[3] is None] if mime_targets else []
+		mime_results = executor.map(_try_detect_mime, unmatched)
+		for entry, (mime_magic, error) in zip(unmatched, mime_results):
+			if error is not None:
+				entry[3:] = ["error", None, str(error)]
+				continue
+			mime_match, mime_target = match_mime(mime_magic, mime_targets)
+			if mime_match:
+				entry[3:] = ["mime", mime_match, mime_target]
+
+		for filename, file_path, _, stage, rule, target in classified:
+			if stage == "error":
+				counts["errors"] += 1
+				add_action(planned, "error", None, file_path, target)
+				continue
+
+			try:
+				# 4) archive fallback
+				if stage is None:
+					stage, rule, target = "archive", "archive_fallback", archive_dir
+
+				destination = make_collision_safe_target(target, filename, name_cache)
+				add_action(planned, stage, rule, file_path, destination)
+				counts["archived" if stage == "archive" else stage] += 1
+
+			except Exception as e:
+				counts["errors"] += 1
+				add_action(planned, "error", None, file_path, str(e))
+				continue
+
+		# Execute or plan
+		if dry_run:
+			actions = planned
+		else:
+			actions = execute_moves(planned, downloads, archive_base, counts, executor)
 
 	# Summary
 	summary = {
@@ -348,6 +750,13 @@ def summarize_config(config_file):
 	}
 
 
+def display_path(path: str) -> str:
+	"""Return path safe to print: undecodable filename bytes (kept by os.scandir as
+	surrogate escapes) are shown as \\xNN instead of raising UnicodeEncodeError.
+	"""
+	return os.fsencode(path).decode("utf-8", "backslashreplace")
+
+
 def pretty_print_plan(summary: dict, dry_run: bool):
 	counts = summary["counts"]
 	actions = summary["actions"]
@@ -363,12 +772,16 @@ def pretty_print_plan(summary: dict, dry_run: bool):
 		print("Planned actions (dry-run):")
 	else:
 		print("Performed actions:")
-	for action in actions:
-		if action[0] == "error":
-			print(f"[ERROR] {a[2]} -> {a[3]}")
+	# sort once here for stable output; discovery and routing do not depend on order
+	rows = sorted(
+		zip(actions["stage"], actions["rule"], actions["src"], actions["dst"]),
+		key=lambda row: os.path.basename(row[2]).lower(),
+	)
+	for stage, rule, src, destination in rows:
+		if stage == "error":
+			print(f"[ERROR] {display_path(src)} -> {display_path(destination)}")
 		else:
-			stage, rule, src, destination = action
-			print(f"[{stage.upper():7}] {Path(src).name} -> {destination} (rule: {rule})")
+			print(f"[{stage.upper():7}] {display_path(os.path.basename(src))} -> {display_path(destination)} (rule: {rule})")
 
 
 def main():
@@ -383,8 +796,14 @@ def main():
 		print(f"Failed to load config: {e}", file=sys.stderr)
 		sys.exit(2)
 
-	# Strict validation (fail-fast)
-	validate_config_paths(config_file)
+	# Strict validation (fail-fast); also resolves routing targets once
+	try:
+		targets = validate_config_paths(config_file)
+	except ConfigValidationError as e:
+		print("CONFIG VALIDATION FAILED:", file=sys.stderr)
+		for err in e.errors:
+			print(f"  - {err}", file=sys.stderr)
+		sys.exit(3)
 
 	# Print config summary
 	config_summary = summarize_config(config_file)
@@ -394,7 +813,7 @@ def main():
 	print(f"MIME rules: {config_summary['mime_rules']}")
 
 	# Run the pipeline
-	summary = process_run(config_file, dry_run=args.dry_run)
+	summary = process_run(config_file, dry_run=args.dry_run, targets=targets)
 
 	# Print plan or results
 	pretty_print_plan(summary, dry_run=args.dry_run)